@@ -1,9 +1,10 @@
 import os
+import re
 import asyncio
 import stat
 import shlex
+from contextlib import suppress
 from functools import partial
-from docopt import docopt
 
 from chaperone.cutil.servers import Server, ServerProtocol
 from chaperone.cutil.misc import maybe_remove
@@ -25,17 +26,38 @@ Usage: telchap status
 CHAP_FIFO = "/dev/chaperone"
 CHAP_SOCK = "/dev/chaperone.sock"
 
+# The small, fixed set of flags our commands accept.  Anything else which looks like an
+# option is a usage error.
+COMMAND_FLAGS = frozenset(('--force', '--wait', '--disable', '--enable'))
+
+def _parse_args(tokens):
+    """
+    A minimal argument parser for our command grammar.  Produces the same options dictionary
+    docopt would, but without re-parsing the usage grammar on every message.  Flags are
+    booleans, everything else is positional.  Raises SystemExit for an unrecognized option
+    (mirroring DocoptExit) so the client sees a COMMAND-ERROR reply.
+    """
+    opts = {'--force': False, '--wait': False, '--disable': False, '--enable': False,
+            '<servname>': [], '<level>': None, '<delay>': None}
+    for t in tokens:
+        if t.startswith('-'):
+            if t not in COMMAND_FLAGS:
+                # Matches docopt's DocoptExit behavior so the client sees COMMAND-ERROR
+                # followed by the usage text, not an EXCEPTION reply.
+                raise SystemExit("Unrecognized option: " + t + "\n" + COMMAND_DOC)
+            opts[t] = True
+        else:
+            opts['<servname>'].append(t)
+    if opts['<servname>']:
+        opts['<level>'] = opts['<delay>'] = opts['<servname>'][0]
+    return opts
+
 class _BaseCommand(object):
 
     command_name = "X"
     interactive_only = False
     interactive = False
 
-    def match(self, opts):
-        if isinstance(self.command_name, tuple):
-            return all(opts.get(name, False) for name in self.command_name)
-        return opts.get(self.command_name, False)
-
     async def exec(self, opts, protocol):
         #result = await self.do_exec(opts, controller)
         #return str(result)
@@ -60,7 +82,7 @@ class statusCommand(_BaseCommand):
 
     async def do_exec(self, opts, controller):
         serv = controller.services
-        msg = STMSG.format(controller, len(serv), len([s for s in serv.values() if s.enabled]))
+        msg = STMSG.format(controller, len(serv), sum(1 for s in serv.values() if s.enabled))
         msg += "\nServices:\n\n" + str(serv.get_status_formatter().get_formatted_data()) + "\n"
         return msg
 
@@ -134,16 +156,17 @@ class loglevelCommand(_BaseCommand):
             curlev = controller.force_log_level()
             if curlev is None:
                 return "Forced Logging Level: NOT SET"
-            try:
-                pri = "*." + syslog_info.PRIORITY[curlev]
-            except IndexError:
-                pri = "Forced Logging Level: UNKNOWN"
-            return pri
+            if 0 <= curlev < len(syslog_info.PRIORITY):
+                return "*." + syslog_info.PRIORITY[curlev]
+            return "Forced Logging Level: UNKNOWN"
         if lev.startswith('*.'):
             lev = lev[2:]
         controller.force_log_level(lev)
         return "All logging set to include priorities >= *." + lev.lower()
             
+# Accepts the same plain and exponent decimal forms float() does (".5", "5.", "1e3", ...).
+_NUM_RE = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
 class shutdownCommand(_BaseCommand):
 
     command_name = "shutdown"
@@ -155,14 +178,13 @@ class shutdownCommand(_BaseCommand):
             delay = 0.1
             message = "Shutting down now"
         else:
-            try:
-                delay = float(delay)
-            except ValueError:
+            if not _NUM_RE.match(delay):
                 return "Specified delay is not a valid decimal number: " + str(delay)
+            delay = float(delay)
             message = "Shutting down in {0} seconds".format(delay)
 
         info("requested shutdown scheduled to occur in {0} seconds".format(delay))
-        asyncio.get_event_loop().call_later(delay, controller.kill_system)
+        asyncio.get_running_loop().call_later(delay, controller.kill_system)
 
         return message
             
@@ -182,6 +204,22 @@ COMMANDS = (
     dependenciesCommand(),
 )
 
+# Prebuilt dispatch table so each message costs one dict lookup rather than a docopt
+# parse of COMMAND_DOC.
+_DISPATCH = dict()
+for _c in COMMANDS:
+    if isinstance(_c.command_name, tuple):
+        for _n in _c.command_name:
+            _DISPATCH[_n] = _c
+    else:
+        _DISPATCH[_c.command_name] = _c
+
+# Reply framing, prebuilt as bytes so the write path never re-encodes a prefix.
+_RESULT_PREFIX = b"RESULT\n"
+_EXCEPTION_PREFIX = b"EXCEPTION\n"
+_ERROR_PREFIX = b"COMMAND-ERROR\n"
+_USAGE_BYTES = COMMAND_DOC.encode()
+
 class CommandProtocol(ServerProtocol):
 
     interactive = False
@@ -190,47 +228,61 @@ class CommandProtocol(ServerProtocol):
         if not msg:
             return
         try:
-            options = docopt(COMMAND_DOC, shlex.split(msg), help=False)
+            # str.split is implemented in C and an order of magnitude faster than building a
+            # shlex lexer; only fall back to shlex when quoting or escapes are actually present.
+            if '"' in msg or "'" in msg or '\\' in msg:
+                tokens = shlex.split(msg)
+            else:
+                tokens = msg.split()
+            if '--help' in tokens:
+                return _RESULT_PREFIX + _USAGE_BYTES
+            command = tokens and _DISPATCH.get(tokens[0])
+            if not command:
+                return _ERROR_PREFIX + _USAGE_BYTES
+            options = _parse_args(tokens[1:])
         except Exception as ex:
-            result = "EXCEPTION\n" + str(ex)
+            result = _EXCEPTION_PREFIX + str(ex).encode()
         except SystemExit as ex:
-            result = "COMMAND-ERROR\n" + str(ex)
+            result = _ERROR_PREFIX + str(ex).encode()
         else:
             result = "?"
-            for c in COMMANDS:
-                if c.match(options) and (not c.interactive_only or self.interactive):
-                    result = await c.exec(options, self)
-                    break
-            result = "RESULT\n" + result
+            if not command.interactive_only or self.interactive:
+                result = await command.exec(options, self)
+            result = _RESULT_PREFIX + result.encode()
         return result
 
     async def _command_task(self, cmd, interactive = False):
         result = await self._interpret_command(cmd)
         if interactive:
-            self.transport.write(result.encode())
+            self.transport.write(result)
             self.transport.close()
 
     def data_received(self, data):
+        message = data.decode()
         if self.interactive:
-            asyncio.ensure_future(self._command_task(data.decode(), True))
+            self.owner.loop.create_task(self._command_task(message, True))
         else:
-            commands = data.decode().split("\n")
-            for c in commands:
-                asyncio.ensure_future(self._command_task(c))
+            # Decode once, skip blank lines, and hand the whole burst to the loop with a
+            # single gather call.  (gather still creates a Task per command internally;
+            # the savings here are the one decode and the skipped empties.)
+            commands = [c for c in message.split("\n") if c]
+            if commands:
+                asyncio.ensure_future(asyncio.gather(*(self._command_task(c) for c in commands)))
 
 class _InteractiveServer(Server):
 
     def _create_server(self):
         maybe_remove(CHAP_SOCK)
-        return asyncio.get_event_loop().create_unix_server(CommandProtocol.buildProtocol(self, interactive=True), 
-                                                           path=CHAP_SOCK)
+        return self.loop.create_unix_server(CommandProtocol.buildProtocol(self, interactive=True),
+                                            path=CHAP_SOCK)
 
     async def server_running(self):
         os.chmod(CHAP_SOCK, 0o777)
 
     def close(self):
         super().close()
-        maybe_remove(CHAP_SOCK)
+        with suppress(FileNotFoundError, PermissionError):
+            os.unlink(CHAP_SOCK)
 
 
 class CommandServer(Server):
@@ -250,30 +302,39 @@ class CommandServer(Server):
         self._fifoname = filename
 
     async def server_running(self):
-        self._iserve = _InteractiveServer()
-        self._iserve.controller = self.controller # share this with our domain socket
-        await self._iserve.run()
+        iserve = _InteractiveServer()
+        iserve.controller = self.controller # share this with our domain socket
+        await iserve.run()
+        self._iserve = iserve   # only kept once it has successfully started
 
     def _open(self):
         name = self._fifoname
 
         maybe_remove(name)
-        if not os.path.exists(name):
+        try:
             os.mkfifo(name)
-
-        if not stat.S_ISFIFO(os.stat(name).st_mode):
-            raise TypeError("File is not a fifo: " + str(name))
+        except FileExistsError:
+            # Removal may have failed (permissions); confirm what's there really is a fifo
+            # without following a symlink.
+            fd = os.open(name, os.O_PATH | os.O_NOFOLLOW)
+            try:
+                mode = os.fstat(fd).st_mode
+            finally:
+                os.close(fd)
+            if not stat.S_ISFIFO(mode):
+                raise TypeError("File is not a fifo: " + str(name))
 
         os.chmod(name, 0o777)
 
-        return open(os.open(name, os.O_RDWR|os.O_NONBLOCK))
+        return open(os.open(name, os.O_RDWR | os.O_NONBLOCK | os.O_CLOEXEC))
             
     def _create_server(self):
-        return asyncio.get_event_loop().connect_read_pipe(CommandProtocol.buildProtocol(self), self._open())
+        return self.loop.connect_read_pipe(CommandProtocol.buildProtocol(self), self._open())
 
     def close(self):
         super().close()
-        maybe_remove(CHAP_FIFO)
+        with suppress(FileNotFoundError, PermissionError):
+            os.unlink(CHAP_FIFO)
         if self._iserve:
             self._iserve.close()
 
@@ -6,9 +6,9 @@ class SimpleProcess(SubProcess):
     _fut_monitor = None
 
     async def process_started_co(self):
-        if self._fut_monitor and not self._fut_monitor.cancelled():
+        if self._fut_monitor and not self._fut_monitor.done():
             self._fut_monitor.cancel()
-            self._fut_monitor = None
+        self._fut_monitor = None
 
         # We wait a short time just to see if the process errors out immediately.  This avoids a retry loop
         # and catches any immediate failures now.
@@ -18,6 +18,15 @@ class SimpleProcess(SubProcess):
         # If there is a pidfile, sit here and wait for a bit
         await self.wait_for_pidfile()
 
+        # If the child has already exited (common on fast-fail restarts), handle it here
+        # rather than paying for a monitor task whose wait() would return immediately.
+
+        result = self.returncode
+        if result is not None:
+            if isinstance(result, int) and result > 0:
+                await self._abnormal_exit(result)
+            return
+
         # We have a successful start.  Monitor this service.
 
         self._fut_monitor = asyncio.ensure_future(self._monitor_service())
@@ -8,10 +8,17 @@ import importlib
 # reasons why a distribution may not allow such patching (though most do).  Exact code is compared,
 # so there is little chance of an error in deciding if the patch is relevant.
 
+# Source extraction reads the file from disk and tokenizes it, so cache the result per target
+# in case the same member is examined more than once.
+_SRC_CACHE = dict()
+
 def PATCH_CLASS(module, clsname, member, oldstr, newfunc):
     try:
         cls = getattr(importlib.import_module(module), clsname)
-        should_be = ''.join(inspect.getsourcelines(getattr(cls, member))[0])
+        key = (module, clsname, member)
+        should_be = _SRC_CACHE.get(key)
+        if should_be is None:
+            should_be = _SRC_CACHE[key] = ''.join(inspect.getsourcelines(getattr(cls, member))[0])
         if should_be == oldstr:
             setattr(cls, member, newfunc)
     except Exception:
@@ -41,7 +41,7 @@ class Server:
         self.events = EventSource(**kwargs)
 
     async def run(self):
-        self.loop = asyncio.get_event_loop()
+        self.loop = asyncio.get_running_loop()
         self.server = await self._create_server()
         await self.server_running()
 